@@ -0,0 +1,528 @@
+# core.py
+import os
+import io
+import asyncio
+import functools
+import re
+import hashlib
+import shutil
+import time
+import zipfile
+import tempfile
+from contextlib import nullcontext
+from pathlib import Path, PurePath, PurePosixPath
+from concurrent.futures import ThreadPoolExecutor
+from diskcache import Cache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+# docx, huggingface_hub and tiktoken are imported inside the functions that use them,
+# so importing this module (e.g. from mcp_server.py) stays cheap
+# -----------------------------
+# 1️⃣ Hugging Face client
+# -----------------------------
+HF_TOKEN = os.getenv("HUGGINGFACE_API_KEY")
+
+def open_client():
+    # One client per review run: its connection pool is bound to the event loop that
+    # opened it, and each Gradio handler runs on its own asyncio.run() loop
+    from huggingface_hub import AsyncInferenceClient
+    return AsyncInferenceClient(api_key=HF_TOKEN)
+
+MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+MAX_CONCURRENT_REVIEWS = 10
+
+# -----------------------------
+# 2️⃣ Review prompt
+# -----------------------------
+PROMPT = """
+You are a senior software engineer reviewing .NET / C# code. 
+Give short, clear feedback in bullet points.
+**Rules:**
+Review the code and provide actionable points under these 4 areas:
+1. **Code Standards** — Naming, formatting, magic numbers, comments
+2. **Security** — SQL injection, input validation, hardcoded secrets, authentication issues
+3. **Reusability** — Duplicate code, missing helper functions, not using libraries
+4. **Refactoring** — Simplify complex code, performance improvements, better error handling
+**Format:**
+- Each suggestion must be a single concise line:  
+  `Line X: Problem — Fix`
+- Always **show both the incorrect and corrected examples** when suggesting naming or syntax improvements.
+- Use **real corrected form** (e.g., `_AuthService` → `_authService`).
+- Keep tone friendly, direct, and professional.
+- Do not repeat identical feedback for multiple lines; combine where possible.
+"""
+SYSTEM_MSG = {"role": "system", "content": PROMPT}
+# Request fields shared by every call; temperature 0 keeps cached reviews deterministic
+CHAT_PARAMS = {"model": MODEL, "temperature": 0}
+
+# Reviews are cached on disk by SHA-256 of model + prompt + code
+review_cache = Cache(".review_cache")
+CACHE_TTL_SECONDS = 7 * 86400
+
+# Files under SMALL_FILE_LINES are packed together into one request
+SMALL_FILE_LINES = 200
+BATCH_TOKEN_BUDGET = 6000
+
+# Files over MAX_FILE_TOKENS are split into chunks of at most CHUNK_TOKENS
+MAX_FILE_TOKENS = 6000
+CHUNK_TOKENS = 5000
+CHUNK_BOUNDARY = re.compile(r"^\s*(class|def|public|private) ")
+
+ignore_folders = ['.venv', 'wwwroot', 'node_modules', '__pycache__', 'bin', 'obj', 'properties']
+ALLOWED_EXTS = [".py", ".js", ".java", ".cs", ".cpp", ".ts", ".cshtml", ".razor"]
+IGNORE = frozenset(ignore_folders)
+EXTS = frozenset(ALLOWED_EXTS)
+
+# Source files are read on a small thread pool so disk reads overlap each other
+file_reader = ThreadPoolExecutor(max_workers=8)
+
+# Extracted ZIPs are kept per content hash and evicted oldest-first past the size cap
+ZIP_CACHE_DIR = os.path.join(tempfile.gettempdir(), "reviewcache")
+ZIP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+ZIP_CACHE_GRACE_SECONDS = 3600
+
+# -----------------------------
+# 3️⃣ Helper functions
+# -----------------------------
+_CACHE_KEY_PREFIX = f"{MODEL}|{PROMPT}|"
+
+def review_cache_key(code_text: str) -> str:
+    return hashlib.sha256((_CACHE_KEY_PREFIX + code_text).encode("utf-8")).hexdigest()
+
+def normalize_code(code_text: str) -> str:
+    # Collapse whitespace inside each line but keep the line count, so a cached
+    # review's "Line X" references still point at the right place. Leading
+    # indentation is kept as-is: in Python it decides which block a line is in.
+    lines = []
+    for line in code_text.splitlines():
+        body = line.lstrip()
+        if not body:
+            lines.append("")
+            continue
+        lines.append(line[:len(line) - len(body)] + re.sub(r"\s+", " ", body).rstrip())
+    return "\n".join(lines)
+
+def near_duplicate_cache_key(code_text: str) -> str:
+    return "norm:" + review_cache_key(normalize_code(code_text))
+
+def get_cached_review(code_text: str):
+    for key in (review_cache_key(code_text), near_duplicate_cache_key(code_text)):
+        cached = review_cache.get(key)
+        if cached is not None:
+            return cached
+    return None
+
+def store_review(code_text: str, review: str):
+    review_cache.set(review_cache_key(code_text), review, expire=CACHE_TTL_SECONDS)
+    review_cache.set(near_duplicate_cache_key(code_text), review, expire=CACHE_TTL_SECONDS)
+
+@functools.cache
+def transport_error_types():
+    # Timeouts and dropped connections from either HTTP backend huggingface_hub may use;
+    # neither httpx's nor aiohttp's subclass the builtin TimeoutError/ConnectionError
+    error_types = [TimeoutError, ConnectionError]
+    try:
+        import httpx
+        error_types.append(httpx.TransportError)
+    except ImportError:
+        pass
+    try:
+        import aiohttp
+        error_types.append(aiohttp.ClientConnectionError)
+    except ImportError:
+        pass
+    return tuple(error_types)
+
+def is_transient_error(error) -> bool:
+    # Retry rate limits (429), server errors (5xx), timeouts and dropped connections;
+    # other 4xx responses will fail the same way again
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, transport_error_types())
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=1, max=8),
+    retry=retry_if_exception(is_transient_error),
+    reraise=True,
+)
+async def ask_model(client, user_content: str) -> str:
+    completion = await client.chat.completions.create(
+        **CHAT_PARAMS,
+        # Fixed system prompt first so providers with prefix caching reuse it
+        messages=[SYSTEM_MSG, {"role": "user", "content": user_content}]
+    )
+    return completion.choices[0].message["content"]
+
+async def analyze_code_with_ai(client, code_text: str, filename: str) -> str:
+    cached = get_cached_review(code_text)
+    if cached is not None:
+        return cached
+    try:
+        review = await ask_model(client, "Review the following code from " + filename + ":\n\n" + code_text)
+    except Exception as e:
+        return f"⚠️ Error: {str(e)}"
+    store_review(code_text, review)
+    return review
+
+@functools.cache
+def token_encoding():
+    # Rust-backed BPE; loaded on first use and shared by every count/split afterwards.
+    # The encoding file is downloaded on first load; if that fails, None is cached and
+    # counts fall back to a chars/4 estimate rather than failing the whole review.
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = token_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def split_by_tokens(text: str):
+    encoding = token_encoding()
+    if encoding is None:
+        step = CHUNK_TOKENS * 4
+        return [text[i:i + step] for i in range(0, len(text), step)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + CHUNK_TOKENS]) for i in range(0, len(tokens), CHUNK_TOKENS)]
+
+def split_into_chunks(code_text: str):
+    # Cut at class/function boundaries, then group the pieces into chunks under CHUNK_TOKENS
+    segments, current = [], []
+    for line in code_text.splitlines(keepends=True):
+        if current and CHUNK_BOUNDARY.match(line):
+            segments.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        segments.append("".join(current))
+
+    chunks, current, current_tokens = [], [], 0
+    for segment in segments:
+        tokens = count_tokens(segment)
+        if current and current_tokens + tokens > CHUNK_TOKENS:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        if tokens > CHUNK_TOKENS:
+            chunks.extend(split_by_tokens(segment))
+            continue
+        current.append(segment)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+
+    # Pair each chunk with its line range so reviews can point back into the file
+    numbered, start = [], 1
+    for chunk in chunks:
+        end = start + chunk.count("\n") - (1 if chunk.endswith("\n") else 0)
+        numbered.append((start, end, chunk))
+        start += chunk.count("\n")
+    return numbered
+
+def is_small_file(code_text: str) -> bool:
+    return code_text.count("\n") < SMALL_FILE_LINES
+
+def pack_small_files(sources):
+    # Greedy bin-packing: fill each batch until the token budget is reached.
+    # Yields (batch, total tokens) so callers don't have to count again.
+    batches, current, current_tokens = [], {}, 0
+    for filename, code in sources.items():
+        tokens = count_tokens(code)
+        if current and current_tokens + tokens > BATCH_TOKEN_BUDGET:
+            batches.append((current, current_tokens))
+            current, current_tokens = {}, 0
+        current[filename] = code
+        current_tokens += tokens
+    if current:
+        batches.append((current, current_tokens))
+    return batches
+
+def split_batch_review(content: str, filenames):
+    # Split only at "## <filename>" headers for files in this batch, so the model's own
+    # subheadings (e.g. "### Security") stay inside that file's review
+    names = "|".join(map(re.escape, sorted(filenames, key=len, reverse=True)))
+    header = re.compile(rf"^#{{2,3}}\s+[`*]*({names})[`*:]*\s*$", re.MULTILINE)
+    parts = header.split(content)
+    reviews = {}
+    for name, body in zip(parts[1::2], parts[2::2]):
+        if body.strip() and name not in reviews:
+            reviews[name] = body.strip()
+    return reviews
+
+async def analyze_batch_with_ai(client, batch) -> dict:
+    files = "\n".join(f"=== FILE: {f} ===\n{c}" for f, c in batch.items())
+    try:
+        content = await ask_model(
+            client,
+            "Review each of the following files separately. Start the review of every file "
+            "with a line `## <filename>` using the exact filename, followed by its points.\n\n" + files
+        )
+    except Exception as e:
+        return {f: f"⚠️ Error: {str(e)}" for f in batch}
+    reviews = split_batch_review(content, batch)
+    for filename, review in reviews.items():
+        store_review(batch[filename], review)
+    return reviews
+
+async def review_all(items):
+    # Same basename later in the walk wins, as in the per-file dict before
+    sources = dict(items)
+    reviews = {}
+    pending = {}
+    for filename, code in sources.items():
+        cached = get_cached_review(code)
+        if cached is not None:
+            reviews[filename] = cached
+        else:
+            pending[filename] = code
+
+    # Reviews are network-bound, so run them concurrently (bounded by a semaphore)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REVIEWS)
+
+    async def review_one(filename, code, tokens=None):
+        if tokens is None:
+            tokens = count_tokens(code)
+        if tokens > MAX_FILE_TOKENS:
+            return {filename: await review_large(filename, code)}
+        async with semaphore:
+            return {filename: await analyze_code_with_ai(client, code, filename)}
+
+    async def review_large(filename, code):
+        chunks = split_into_chunks(code)
+
+        async def review_chunk(start, end, chunk):
+            async with semaphore:
+                return await analyze_code_with_ai(client, chunk, f"{filename} (lines {start}-{end})")
+
+        results = await asyncio.gather(*[review_chunk(*c) for c in chunks])
+        return "\n\n".join(f"Lines {start}-{end}:\n{r}" for (start, end, _), r in zip(chunks, results))
+
+    async def review_batch(batch, tokens):
+        if len(batch) == 1:
+            return await review_one(*next(iter(batch.items())), tokens)
+        async with semaphore:
+            batch_reviews = await analyze_batch_with_ai(client, batch)
+        # Anything the model left out of its answer is reviewed on its own
+        missing = [review_one(f, c) for f, c in batch.items() if f not in batch_reviews]
+        for result in await asyncio.gather(*missing):
+            batch_reviews.update(result)
+        return batch_reviews
+
+    # Identical files (generated or vendored code) are reviewed once and the result shared
+    hash_to_files = {}
+    for filename, code in pending.items():
+        digest = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+        hash_to_files.setdefault(digest, []).append(filename)
+    unique = {files[0]: pending[files[0]] for files in hash_to_files.values()}
+
+    small = {f: c for f, c in unique.items() if is_small_file(c)}
+    async with open_client() as client:
+        tasks = [review_one(f, c) for f, c in unique.items() if f not in small]
+        tasks += [review_batch(batch, tokens) for batch, tokens in pack_small_files(small)]
+        for result in await asyncio.gather(*tasks):
+            reviews.update(result)
+    for files in hash_to_files.values():
+        for filename in files[1:]:
+            reviews[filename] = reviews[files[0]]
+    return {f: reviews[f] for f in sources}
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
+
+def cached_tree_size(entry):
+    # Sizes are recorded in "<tree>.size" at extraction, so eviction never walks the trees
+    size_file = entry + ".size"
+    try:
+        with open(size_file) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        size = folder_size(entry)
+        with open(size_file, "w") as f:
+            f.write(str(size))
+        return size
+
+def evict_zip_cache(keep):
+    # Trees used within the grace window may still be open in a UI session; never evict them
+    cutoff = time.time() - ZIP_CACHE_GRACE_SECONDS
+    entries = [os.path.join(ZIP_CACHE_DIR, name) for name in os.listdir(ZIP_CACHE_DIR)
+               if not name.startswith(".extract-")]
+    entries = sorted((e for e in entries if os.path.isdir(e)), key=os.path.getmtime)
+    sizes = {e: cached_tree_size(e) for e in entries}
+    total = sum(sizes.values())
+    for entry in entries:
+        if total <= ZIP_CACHE_MAX_BYTES or os.path.getmtime(entry) > cutoff:
+            break
+        if entry == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.remove(entry + ".size")
+        except OSError:
+            pass
+        total -= sizes[entry]
+
+def extract_zip_to_temp(zip_file_path):
+    os.makedirs(ZIP_CACHE_DIR, exist_ok=True)
+    dest = os.path.join(ZIP_CACHE_DIR, hash_file(zip_file_path))
+    if os.path.isdir(dest):
+        # Same archive as before: reuse the extraction and mark it recently used
+        os.utime(dest)
+        return dest
+    temp_dir = tempfile.mkdtemp(prefix=".extract-", dir=ZIP_CACHE_DIR)
+    extracted_bytes = 0
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        # Only extract reviewable files; dependencies and build output never hit disk
+        for info in zip_ref.infolist():
+            if info.is_dir() or os.path.splitext(info.filename)[1] not in EXTS:
+                continue
+            if is_ignored(PurePosixPath(info.filename).parent):
+                continue
+            zip_ref.extract(info, temp_dir)
+            extracted_bytes += info.file_size
+    try:
+        os.rename(temp_dir, dest)
+    except OSError:
+        # Another call extracted the same archive first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    else:
+        with open(dest + ".size", "w") as f:
+            f.write(str(extracted_bytes))
+    evict_zip_cache(keep=dest)
+    return dest
+
+def is_ignored(rel_path) -> bool:
+    # Match whole path components, so "bin" skips src/bin but not src/binary
+    return not IGNORE.isdisjoint(PurePath(rel_path).parts)
+
+def list_subfolders(folder_path):
+    folders = [os.path.basename(folder_path)]
+    for root, dirs, _ in os.walk(folder_path):
+        # Prune ignored folders in place so os.walk never descends into them
+        dirs[:] = [d for d in dirs if d not in IGNORE]
+        for d in dirs:
+            rel_path = os.path.relpath(os.path.join(root, d), folder_path)
+            folders.append(rel_path)
+    return folders
+
+def selected_roots(base_path, selected_folders):
+    paths = []
+    for subfolder in selected_folders:
+        if subfolder == os.path.basename(base_path):
+            full_path = os.path.normpath(base_path)
+        elif is_ignored(subfolder):
+            continue
+        else:
+            full_path = os.path.normpath(os.path.join(base_path, subfolder))
+        if full_path not in paths:
+            paths.append(full_path)
+    # Drop folders nested inside another selected folder so every file is walked once
+    return [p for p in paths if not any(o != p and os.path.commonpath([o, p]) == o for o in paths)]
+
+def iter_source_files(base_path, selected_folders):
+    for full_path in selected_roots(base_path, selected_folders):
+        for root, dirs, files in os.walk(full_path):
+            dirs[:] = [d for d in dirs if d not in IGNORE]
+            for file in files:
+                if os.path.splitext(file)[1] in EXTS:
+                    yield os.path.join(root, file)
+
+def _read_source(path) -> str:
+    # Each file is read exactly once; the decoded text is passed down the pipeline
+    return Path(path).read_text(encoding="utf-8", errors="ignore")
+
+async def process_selected_folders(base_path, selected_folders):
+    loop = asyncio.get_running_loop()
+    paths = list(iter_source_files(base_path, selected_folders))
+    codes = await asyncio.gather(*[loop.run_in_executor(file_reader, _read_source, p) for p in paths])
+    items = [(os.path.basename(p), code) for p, code in zip(paths, codes)]
+    return await review_all(items)
+
+async def process_file(file_path):
+    return await review_all([(os.path.basename(file_path), _read_source(file_path))])
+
+@functools.cache
+def _report_template():
+    # Serialized once; each report is loaded from these bytes instead of rebuilt
+    from docx import Document
+    doc = Document()
+    doc.add_heading("Code Review Report", 0)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def _paragraph_xml(text, style_id=None):
+    # Build <w:p> directly; same output as add_paragraph/add_heading without the per-call lookups
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    p = OxmlElement("w:p")
+    if style_id:
+        p_pr = OxmlElement("w:pPr")
+        p_style = OxmlElement("w:pStyle")
+        p_style.set(qn("w:val"), style_id)
+        p_pr.append(p_style)
+        p.append(p_pr)
+    r = OxmlElement("w:r")
+    for i, line in enumerate(text.split("\n")):
+        if i:
+            r.append(OxmlElement("w:br"))
+        t = OxmlElement("w:t")
+        t.set(qn("xml:space"), "preserve")
+        t.text = line
+        r.append(t)
+    p.append(r)
+    return p
+
+def generate_report(reviews, out="review_report.docx"):
+    # out is a path or a writable binary file object (e.g. io.BytesIO)
+    from docx import Document
+    doc = Document(io.BytesIO(_report_template()))
+    paragraphs = []
+    for fname, review in reviews.items():
+        paragraphs.append(_paragraph_xml(fname, "Heading1"))
+        paragraphs.append(_paragraph_xml(review))
+    # Insert in one go, ahead of the trailing section properties
+    body = doc.element.body
+    index = body.index(body.sectPr) if body.sectPr is not None else len(body)
+    body[index:index] = paragraphs
+    doc.save(out)
+    return out
+
+def generate_markdown_report(reviews, out="review_report.md"):
+    # Streamed section by section to a path or a writable binary file object
+    with open(out, "wb") if isinstance(out, (str, os.PathLike)) else nullcontext(out) as f:
+        f.write(b"# Code Review Report\n\n")
+        for fname, review in reviews.items():
+            f.write(f"## {fname}\n\n{review}\n\n".encode("utf-8"))
+    return out
+
+def bundle_reports(reviews_by_file) -> bytes:
+    # One Markdown file per review, zipped in memory; nothing touches disk
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=3) as zf:
+        for fname, review in reviews_by_file.items():
+            zf.writestr(f"{fname}.md", f"# {fname}\n\n{review}\n")
+    return buffer.getvalue()
+
+def write_report(reviews, output_stem="review_report", as_docx=False):
+    # Markdown by default; DOCX only when explicitly requested
+    if as_docx:
+        return generate_report(reviews, output_stem + ".docx")
+    return generate_markdown_report(reviews, output_stem + ".md")
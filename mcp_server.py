@@ -1,39 +1,109 @@
 # mcp_server.py
 import os
+import io
+import asyncio
+import uuid
+import base64
+from collections import OrderedDict
 from mcp.server.fastmcp import FastMCP
-from app import analyze_code_with_ai, process_file, process_selected_folders, extract_zip_to_temp, generate_report
+from mcp.types import BlobResourceContents, EmbeddedResource, TextContent
+from starlette.responses import PlainTextResponse, Response
+from core import process_file, process_selected_folders, extract_zip_to_temp, generate_report, generate_markdown_report, bundle_reports
 
 app = FastMCP("AI Code Review")
 
-REPORTS_DIR = "reports"
-os.makedirs(REPORTS_DIR, exist_ok=True)
+# Download links point here; set PUBLIC_BASE_URL when the server sits behind a proxy
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL")
+
+# Reports are only built when /files/ is fetched; most callers just read the returned text.
+# Entries are keyed by a unique report id, kept in LRU order, and hold the rendered bytes once generated.
+MAX_STORED_REPORTS = 32
+stored_reports = OrderedDict()
+
+def public_url():
+    if PUBLIC_BASE_URL:
+        return PUBLIC_BASE_URL.rstrip("/")
+    return f"http://{app.settings.host}:{app.settings.port}"
+
+def store_report(report_filename, reviews, as_docx):
+    report_id = uuid.uuid4().hex
+    stored_reports[report_id] = {"filename": report_filename, "reviews": reviews, "docx": as_docx, "data": None}
+    while len(stored_reports) > MAX_STORED_REPORTS:
+        stored_reports.popitem(last=False)
+    return f"{public_url()}/files/{report_id}/{report_filename}"
+
+@app.custom_route("/files/{report_id}/{report_filename}", methods=["GET"])
+async def download_report(request):
+    report_id = request.path_params["report_id"]
+    report = stored_reports.get(report_id)
+    if report is None:
+        return PlainTextResponse("⚠️ Report not found.", status_code=404)
+    stored_reports.move_to_end(report_id)
+    if report["data"] is None:
+        buffer = io.BytesIO()
+        if report["docx"]:
+            generate_report(report["reviews"], buffer)
+        else:
+            generate_markdown_report(report["reviews"], buffer)
+        report["data"] = buffer.getvalue()
+    media_type = (
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        if report["docx"] else "text/markdown; charset=utf-8"
+    )
+    headers = {"Content-Disposition": f'attachment; filename="{report["filename"]}"'}
+    return Response(report["data"], media_type=media_type, headers=headers)
 
 @app.tool()
-def review_file(file_path: str) -> str:
+async def review_file(file_path: str, docx: bool = False) -> str:
     if not os.path.exists(file_path):
         return "⚠️ File not found."
-    reviews = process_file(file_path)
-    report_filename = f"{os.path.basename(file_path)}_review.docx"
-    report_path = os.path.join(REPORTS_DIR, report_filename)
-    generate_report(reviews, report_path)
-    download_url = f"{app.get_public_url()}/files/{report_filename}"
+    reviews = await process_file(file_path)
+    report_filename = f"{os.path.basename(file_path)}_review" + (".docx" if docx else ".md")
+    download_url = store_report(report_filename, reviews, docx)
     return "\n\n".join([f"{f}:\n{r}" for f, r in reviews.items()]) + f"\n\n✅ Download report: {download_url}"
 
-@app.tool()
-def review_zip(zip_path: str, folders: list[str] = None) -> str:
+async def collect_zip_reviews(zip_path, folders):
+    # Shared by the ZIP tools; returns (reviews, None) or (None, error message)
     if not os.path.exists(zip_path):
-        return "⚠️ ZIP file not found."
-    base_path = extract_zip_to_temp(zip_path)
+        return None, "⚠️ ZIP file not found."
+    # Hashing, extraction and eviction are blocking disk work; keep them off the event loop
+    base_path = await asyncio.to_thread(extract_zip_to_temp, zip_path)
     if not folders:
         folders = [os.path.basename(base_path)]
-    reviews = process_selected_folders(base_path, folders)
+    reviews = await process_selected_folders(base_path, folders)
     if not reviews:
-        return "⚠️ No code files found."
-    report_filename = f"{os.path.basename(zip_path)}_review.docx"
-    report_path = os.path.join(REPORTS_DIR, report_filename)
-    generate_report(reviews, report_path)
-    download_url = f"{app.get_public_url()}/files/{report_filename}"
+        return None, "⚠️ No code files found."
+    return reviews, None
+
+@app.tool()
+async def review_zip(zip_path: str, folders: list[str] = None, docx: bool = False) -> str:
+    reviews, error = await collect_zip_reviews(zip_path, folders)
+    if error:
+        return error
+    report_filename = f"{os.path.basename(zip_path)}_review" + (".docx" if docx else ".md")
+    download_url = store_report(report_filename, reviews, docx)
     return "\n\n".join([f"{f}:\n{r}" for f, r in reviews.items()]) + f"\n\n✅ Download report: {download_url}"
 
+# Unstructured: an output schema would echo the base64 blob again in structuredContent
+@app.tool(structured_output=False)
+async def review_zip_bundle(zip_path: str, folders: list[str] = None) -> list[TextContent | EmbeddedResource]:
+    reviews, error = await collect_zip_reviews(zip_path, folders)
+    if error:
+        return [TextContent(type="text", text=error)]
+    bundle = bundle_reports(reviews)
+    bundle_name = f"{os.path.basename(zip_path)}_reviews.zip"
+    return [
+        TextContent(type="text", text=f"✅ {len(reviews)} reviews bundled in {bundle_name}"),
+        EmbeddedResource(
+            type="resource",
+            resource=BlobResourceContents(
+                uri=f"file:///{bundle_name}",
+                mimeType="application/zip",
+                blob=base64.b64encode(bundle).decode("ascii"),
+            ),
+        ),
+    ]
+
 if __name__ == "__main__":
-    app.run()
+    # /files/ is a custom HTTP route, so the server has to run over HTTP rather than stdio
+    app.run(transport="streamable-http")